@@ -4,6 +4,7 @@ the data on a schedule.
 """
 import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from zipfile import ZipFile as zf
@@ -33,10 +34,14 @@ def pycurl_download():
 
     output_list = [f"{zip_data_path}/Real_building_land.zip", f"{zip_data_path}/Real_acct_owner.zip"]
 
-    response = requests.get(url_list[0], allow_redirects=True, verify=False)
-
-    with open("zipped_data/Real_acct_owner.zip", 'wb') as file:
-        file.write(response)
+    # One session keeps the connection to download.hcad.org open for both files
+    with requests.Session() as session:
+        for url, output in zip(url_list, output_list):
+            with session.get(url, allow_redirects=True, verify=False, stream=True) as response:
+                response.raise_for_status()
+                with open(output, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        file.write(chunk)
 
 
 def download_zip(year=datetime.now().strftime("%Y")):
@@ -67,7 +72,7 @@ def unzip_files(file, dest):
     """
     file_list = ["building_res.txt", "real_acct.txt"]
 
-    with zf(file, "w") as zip_obj:
+    with zf(file, "r") as zip_obj:
         list_of_file_names = zip_obj.namelist()
 
         for file_name in list_of_file_names:
@@ -82,6 +87,11 @@ if __name__ == "__main__":
     pycurl_download()
 
     print("Extracting data...")
-    # Extract files
-    unzip_files(os.path.join(zip_data_path, "Real_building_land.zip"), os.path.join(text_data_path, "real_acct.txt"))
-    unzip_files(os.path.join(zip_data_path, "Real_acct_owner.zip"), os.path.join(text_data_path, "building_res.txt"))
+    # Extract files, both archives are inflated at the same time since zlib releases the GIL
+    zip_list = [os.path.join(zip_data_path, "Real_building_land.zip"),
+                os.path.join(zip_data_path, "Real_acct_owner.zip")]
+    # Create the destination up front, otherwise both threads race to create it
+    os.makedirs(text_data_path, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=len(zip_list)) as executor:
+        for future in [executor.submit(unzip_files, zip_file, text_data_path) for zip_file in zip_list]:
+            future.result()
@@ -1,38 +1,83 @@
 import os
 
 import pandas as pd
-from sqlalchemy import create_engine
+import xlsxwriter
+from sqlalchemy import create_engine, event
+
+from insert_data import detect_text_encoding
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tunes every new SQLite connection for the read heavy export queries.
+
+    Parameters
+    dbapi_connection [Connection] = the sqlite3 connection that was just opened
+    connection_record [ConnectionRecord] = the pool record of the connection, unused
+    """
+    cursor = dbapi_connection.cursor()
+    # WAL lets the web app read while the loader writes, mmap and a larger cache keep hot pages in memory
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+    cursor.execute("PRAGMA cache_size=-131072;")
+    cursor.execute("PRAGMA mmap_size=1073741824;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.close()
+
+
 # Create engine to connect with DB
 try:
     engine = create_engine('sqlite:///' + os.path.join(basedir, 'database.sqlite'))
+    event.listen(engine, 'connect', set_sqlite_pragmas)
 except:
     print("Can't create engine")
 
 
-def load_data_to_sqlite():
-    # read residential data to dataframe
-    res = pd.read_csv(r'Data/building_res.txt', delimiter='\t', encoding='mbcs')
-
-    # read land data to dataframe
-    land = pd.read_csv(r'Data/land.txt', delimiter='\t', encoding='utf-8')
+def load_csv_to_table(file_path, table_name, connection, chunksize=100000):
+    """
+    Reads a tab separated file in chunks and writes each chunk to a table, replacing the table first.
+
+    Parameters
+    file_path [string] = the path to the text file that has all the data
+    table_name [string] = the name of the table the data will be inserted into
+    connection [Connection] = sqlalchemy connection the data is written with
+    chunksize [integer] = the number of lines held in memory at once
+    """
+    # Detect the encoding instead of relying on the Windows only mbcs codec, the detection reads
+    # past an ASCII prefix so cp1252 files are not decoded as utf-8 and replaced with U+FFFD
+    encoding = detect_text_encoding(file_path)
+    insert_sql = None
+    # Raw sqlite3 cursor on the same connection, its executemany consumes the rows lazily
+    cursor = connection.connection.cursor()
+    # Every column is read as str, each chunk is parsed on its own so inferred types would depend on
+    # where the chunks happen to split and codes like '00123' would lose their leading zeros
+    for chunk in pd.read_csv(file_path, delimiter='\t', dtype=str, encoding=encoding, encoding_errors='replace',
+                             chunksize=chunksize):
+        if insert_sql is None:
+            # Let pandas create the table from the first chunk, the rows go through executemany
+            chunk.head(0).to_sql(table_name, con=connection, if_exists='replace', index=False)
+            inserts = ",".join("?" * len(chunk.columns))
+            insert_sql = f'INSERT INTO "{table_name}" VALUES ({inserts})'
+        # A header only file still gives one empty chunk, the table is created but there is nothing to insert
+        if not chunk.empty:
+            cursor.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+    cursor.close()
 
-    # read owners data to dataframe
-    real_acct = pd.read_csv(r'Data/real_acct.txt', delimiter='\t', encoding='mbcs')
 
+def load_data_to_sqlite():
     with engine.begin() as connection:
         # Insert data for buildingres table
-        res.to_sql('building_res', con=connection, if_exists='replace')
+        load_csv_to_table(r'Data/building_res.txt', 'building_res', connection)
         print('buildingres table updated...')
 
         # Insert data for lands
-        land.to_sql('land', con=connection, if_exists='replace')
+        load_csv_to_table(r'Data/land.txt', 'land', connection)
         print('lands table updated...')
 
         # insert data for owners
-        real_acct.to_sql('real_acct', con=connection, if_exists='replace')
+        load_csv_to_table(r'Data/real_acct.txt', 'real_acct', connection)
         print('owners table updated...')
         print('Done, ok!')
 
@@ -48,31 +93,59 @@ def extract_excel_file(account="", street="", zip_code=""):
         CAST(ra.acct AS TEXT) AS 'Account Number',
         ra.tot_mkt_val AS 'Market Value',
         br.im_sq_ft AS 'Building Area',
-        (ra.tot_mkt_val / br.im_sq_ft) AS 'Price Per Sq Ft',
+        ROUND(CAST(ra.tot_mkt_val AS REAL) / NULLIF(CAST(br.im_sq_ft AS REAL), 0), 2) AS 'Price Per Sq Ft',
         ra.land_ar AS 'Land Area'
     FROM real_acct AS ra
     JOIN building_res AS br ON ra.acct = br.acct
     WHERE """
 
+    # Filter values are bound as parameters so the SQL text only depends on which
+    # filters are set and SQLite can reuse the prepared statement
+    conditions = []
+    params = []
     file_name = ''
     if account is not empty_str:
-        sql += "ra.acct LIKE '%" + account + "%' AND "
+        conditions.append("ra.acct LIKE ?")
+        params.append('%' + account + '%')
         file_name += account + ' '
     if street is not empty_str:
-        sql += "ra.site_addr_1 LIKE '%" + street + "%' AND "
+        conditions.append("ra.site_addr_1 LIKE ?")
+        params.append('%' + street + '%')
         file_name += street + ' '
     if zip_code is not empty_str:
-        sql += "ra.site_addr_3 LIKE '%" + zip_code + "%' AND "
+        conditions.append("ra.site_addr_3 LIKE ?")
+        params.append('%' + zip_code + '%')
         file_name += zip_code + ' '
 
     # Add closing colon
-    sql = sql[:-5] + ';'
+    sql += " AND ".join(conditions) + ';'
 
     # Fix filename
     file_name += 'Home Info.xlsx'
 
     # Start connection with sqlite database
     with engine.begin() as connection:
-        df = pd.read_sql(sql, con=connection)
-        df.to_excel('Exports/' + file_name, sheet_name='Info', engine='openpyxl')
+        result = connection.exec_driver_sql(sql, tuple(params))
+
+        # Write rows straight from the cursor, constant memory mode flushes each row to disk
+        # The with block closes the workbook and its temp files even when a fetch or write fails
+        file_path = 'Exports/' + file_name
+        try:
+            with xlsxwriter.Workbook(file_path, {'constant_memory': True}) as workbook:
+                worksheet = workbook.add_worksheet('Info')
+                worksheet.write_row(0, 0, list(result.keys()))
+                # Pull rows from the cursor with fetchmany instead of one fetch per row
+                row_num = 0
+                for rows in result.partitions(1000):
+                    for row in rows:
+                        row_num += 1
+                        # write_row does not raise past the last sheet row, it returns -1 and drops the row
+                        if worksheet.write_row(row_num, 0, row) == -1:
+                            raise ValueError(f"More than {row_num - 1} rows match the search, "
+                                             f"they do not fit in one Excel sheet")
+        except Exception:
+            # Closing the workbook still saves what was written, never leave a partial export behind
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
         return file_name
@@ -1,3 +1,4 @@
+import codecs
 import os
 import sqlite3
 
@@ -6,6 +7,64 @@ def strip_list(l):
     return [x.strip() for x in l]
 
 
+def detect_text_encoding(text_file_path, block_size=65536):
+    """
+    Guesses the encoding of a text file from the first block that holds a non-ASCII byte.
+
+    Parameters
+    text_file_path [string] = the path to the text file
+    block_size [integer] = the number of bytes read at a time
+    """
+    with open(text_file_path, 'rb') as f:
+        block = f.read(block_size)
+        if block.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+
+        # ASCII decodes the same in both encodings, keep reading until a byte can decide it
+        while block and block.isascii():
+            block = f.read(block_size)
+        if not block:
+            return 'utf-8'
+
+        # Complete a multibyte character cut off at the end of the block
+        extra = f.read(3)
+        block += extra
+
+    try:
+        block.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Only a character cut off by the read itself is still utf-8
+        cut_off = e.reason == 'unexpected end of data' and len(extra) == 3 and e.start >= len(block) - 3
+        if not cut_off:
+            return 'cp1252'
+    return 'utf-8'
+
+
+def read_rows(text_file_path, table_name, num_of_cols):
+    """
+    Reads a text file line by line and yields each line as a tuple of stripped values.
+
+    Parameters
+    text_file_path [string] = the path to the text file that has all the data
+    table_name [string] = the name of the table the data will be inserted into, used for reporting
+    num_of_cols [integer] = the number of columns a line must have to be yielded
+    """
+    # Some files are not uft-8, decode them in bulk with the detected encoding
+    encoding = detect_text_encoding(text_file_path)
+    # Only \n ends a line, a stray \r inside a field stays part of the field
+    with open(text_file_path, encoding=encoding, errors='replace', newline='\n') as f:
+        # Skip the header line
+        next(f, None)
+        for line_num, line in enumerate(f, 1):
+            # Never split past one extra column, longer lines are rejected anyway
+            line_list = line.split("\t", num_of_cols)
+            if len(line_list) == num_of_cols:
+                yield tuple(strip_list(line_list))
+            else:
+                elements = line.count("\t") + 1
+                print(f"{table_name} line number {line_num} has {elements} elements!")
+
+
 def insert_data(text_file_path, table_name, num_of_cols, cur):
     """
     Reads a text file line by line and inserts each lin into a database.
@@ -18,22 +77,14 @@ def insert_data(text_file_path, table_name, num_of_cols, cur):
     """
     inserts = "?," * num_of_cols
     inserts = inserts[:-1]
-    line_num = 0
-    with open(text_file_path, 'rb') as f:
-        for line in f:
-            # Some files are not uft-8 and need to be decoded
-            line = line.decode(errors='replace')
-            line_list = line.split("\t")
-            line_list = tuple(strip_list(line_list))
-            line_len = len(line_list)
-            if line_num != 0 and line_len == num_of_cols:
-                cur.executemany(f"INSERT INTO {table_name} VALUES ({inserts})", (line_list,))
-            else:
-                print(f"{table_name} line number {line_num} has {len(line_list)} elements!")
-                line_num += 1
+    # A single executemany over the generator lets sqlite3 reuse one prepared statement
+    cur.executemany(f"INSERT INTO {table_name} VALUES ({inserts})",
+                    read_rows(text_file_path, table_name, num_of_cols))
 
 
 def load_data():
+    # Set before the try so the finally block can tell whether the connect itself failed
+    con = None
     try:
         con = sqlite3.connect("database.sqlite")
 
@@ -41,6 +92,13 @@ def load_data():
 
         print("\tSuccessfully connected to SQLite")
 
+        # Bulk load settings, the tables are rebuilt from the text files so
+        # durability of an interrupted load does not matter
+        cur.execute("PRAGMA journal_mode=WAL;")
+        cur.execute("PRAGMA synchronous=OFF;")
+        cur.execute("PRAGMA temp_store=MEMORY;")
+        cur.execute("PRAGMA cache_size=-262144;")
+
         cur.execute("DROP TABLE IF EXISTS building_res;")
 
         cur.execute("""CREATE TABLE IF NOT EXISTS building_res (
@@ -162,6 +220,12 @@ def load_data():
         print("\tInserting real_acct data...")
         insert_data(os.path.join(dirname, "text_files/real_acct.txt"), "real_acct", 71, cur)
 
+        # Build the join index once the rows are in instead of maintaining it on every insert,
+        # it also carries the columns the export reads so building_res rows are never visited
+        print("\tCreating indexes...")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_building_res_acct ON building_res (acct, eff, im_sq_ft);")
+        cur.execute("ANALYZE;")
+
         con.commit()
 
         cur.close()